@@ -0,0 +1,177 @@
+import argparse
+import asyncio
+import os
+import random
+import time
+
+import numpy as np
+
+# --- БЕНЧМАРКИ ---
+# python bench.py micro — расчет карты каждым доступным бэкендом, кэш, сериализация, транзиты, синастрия
+# python bench.py load  — нагрузка на /calculate, /interpret, /personal_horoscope и /synastry внутри процесса
+#                         (httpx через ASGI, без сети), модель Gemini заменена заглушкой LLM_STUB
+# python bench.py       — оба набора
+# Нагрузочному прогону нужен httpx (requirements-dev.txt).
+# Для каждого сценария печатаются p50/p99 и пропускная способность; входные данные
+# генерируются с фиксированным seed, поэтому прогоны сравнимы между собой.
+
+SEED = 1234
+
+
+def random_birth(rng):
+    moment = f"{rng.randint(1930, 2020)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00Z"
+    return {
+        "birthDateTime": moment,
+        "latitude": round(rng.uniform(-60.0, 65.0), 4),
+        "longitude": round(rng.uniform(-180.0, 180.0), 4),
+        "zoneId": "UTC",
+    }
+
+
+def summary(samples, elapsed=None):
+    # samples: длительности в секундах -> p50/p99 в миллисекундах и операций в секунду
+    values = np.array(samples)
+    return {
+        "n": len(samples),
+        "p50_ms": round(float(np.percentile(values, 50)) * 1000, 4),
+        "p99_ms": round(float(np.percentile(values, 99)) * 1000, 4),
+        "ops_per_s": round(len(samples) / (elapsed if elapsed is not None else values.sum()), 1),
+    }
+
+
+def measure(func, args_list):
+    samples = []
+    for args in args_list:
+        started = time.perf_counter()
+        func(*args)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def print_row(name, stats, extra=""):
+    print(f"{name:<36} n={stats['n']:<6} p50={stats['p50_ms']:>9.3f}ms  p99={stats['p99_ms']:>9.3f}ms  {stats['ops_per_s']:>9.1f}/s {extra}")
+
+
+# --- МИКРОБЕНЧМАРКИ ---
+def micro(iterations):
+    from chart_backends import BACKENDS
+    from chart_cache import ChartCache
+    from chart_encoding import COMPACT, MSGPACK, VERBOSE, encode_chart, supported_encodings
+    from main import parse_birth_datetime
+    from synastry import ChartStore, rank, synastry
+    from transits import compute_transits, julian_day, natal_points
+
+    rng = random.Random(SEED)
+    births = [random_birth(rng) for _ in range(iterations)]
+    args_list = [parse_birth_datetime(b["birthDateTime"]) + (b["latitude"], b["longitude"]) for b in births]
+
+    print("# micro")
+    charts = None
+    for name, cls in BACKENDS.items():
+        try:
+            backend = cls()
+            backend.init_worker()
+            backend.warm_up()
+        except Exception as e:
+            print(f"{'chart/' + name:<36} unavailable: {e}")
+            continue
+        # flatlib и ephem заметно медленнее, им хватает меньшей выборки
+        sample = args_list if name in ("tables", "swisseph") else args_list[:max(iterations // 10, 10)]
+        print_row(f"chart/{name}", summary(measure(backend.calculate, sample)))
+        if charts is None:
+            charts = [backend.calculate(*args) for args in args_list[:200]]
+
+    if charts is None:
+        return
+
+    cache = ChartCache(max_entries=len(charts))
+    keys = [f"k{i}" for i in range(len(charts))]
+    for key, chart in zip(keys, charts):
+        cache.put(key, chart)
+    print_row("chart_cache/get", summary(measure(cache.get, [(k,) for k in keys] * 20)))
+    # Сериализация как в /calculate: каждый формат, который предлагает chart_encoding
+    names = {VERBOSE: "verbose", COMPACT: "compact", MSGPACK: "msgpack"}
+    for encoding in supported_encodings():
+        print_row(f"serialize/{names[encoding]}", summary(measure(encode_chart, [(c, encoding) for c in charts])))
+
+    jd = julian_day("2024/01/01", "00:00")
+    natal = [(natal_points(c), jd, jd + 365.0, 1.0) for c in charts[:20]]
+    print_row("transits/year_daily", summary(measure(compute_transits, natal)))
+
+    pairs = [(charts[i], charts[-1 - i]) for i in range(len(charts) // 2)]
+    print_row("synastry/pair", summary(measure(synastry, pairs)))
+
+    store = ChartStore()
+    for i in range(10000):
+        store.add(f"c{i}", charts[i % len(charts)])
+    print_row("synastry/rank_10k", summary(measure(rank, [(c, store) for c in charts[:20]])))
+
+
+# --- НАГРУЗКА ---
+def load_scenarios(rng, pool_size):
+    # Повторы входных данных из небольшого пула: клиенты часто запрашивают одну и ту же карту
+    births = [random_birth(rng) for _ in range(pool_size)]
+    return {
+        "/calculate": lambda: rng.choice(births),
+        "/interpret": lambda: rng.choice(births),
+        "/personal_horoscope": lambda: rng.choice(births),
+        "/synastry": lambda: {"first": rng.choice(births), "second": rng.choice(births)},
+    }
+
+
+async def drive(client, path, make_body, requests, concurrency):
+    latencies, errors = [], 0
+    bodies = [make_body() for _ in range(requests)]
+
+    async def worker():
+        nonlocal errors
+        while bodies:
+            body = bodies.pop()
+            started = time.perf_counter()
+            response = await client.post(path, json=body)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+async def load(requests, concurrency, pool_size):
+    os.environ.setdefault("LLM_STUB", "1")
+    import httpx
+    import main
+    from metrics import metrics
+
+    rng = random.Random(SEED)
+    print(f"# load: {requests} requests per endpoint, concurrency {concurrency}, {pool_size} distinct inputs")
+    async with main.lifespan(main.app):
+        await main.startup_task
+        print(f"backend={main.chart_backend.name} model={main.llm.model.model_name} pool={main.CHART_POOL_KIND}x{main.CHART_WORKERS}")
+        metrics.reset()
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for path, make_body in load_scenarios(rng, pool_size).items():
+                latencies, errors, elapsed = await drive(client, path, make_body, requests, concurrency)
+                print_row(path, summary(latencies, elapsed), f"errors={errors}")
+
+    # Среднее время этапов за весь прогон: где именно тратится время
+    print("# stages (mean)")
+    for labels, histogram in metrics.histograms("stage_duration_seconds"):
+        print(f"{labels['stage']:<36} n={histogram.count:<6} mean={histogram.sum / histogram.count * 1000:>9.3f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmarks and in-process load test")
+    parser.add_argument("suite", nargs="?", choices=["micro", "load", "all"], default="all")
+    parser.add_argument("--iterations", type=int, default=2000, help="charts per backend in micro")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per endpoint in load")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--pool", type=int, default=500, help="distinct birth inputs in load")
+    args = parser.parse_args()
+
+    if args.suite in ("micro", "all"):
+        micro(args.iterations)
+    if args.suite in ("load", "all"):
+        asyncio.run(load(args.requests, args.concurrency, args.pool))
@@ -0,0 +1,331 @@
+import logging
+import math
+import os
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+EPHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ephe")
+
+# Тела в порядке ответа /calculate
+BODY_NAMES = [
+    "Sun", "Moon", "Mercury", "Venus", "Mars", "Jupiter", "Saturn",
+    "Uranus", "Neptune", "Pluto", "Chiron", "NNode"
+]
+
+SIGNS = ["Aries", "Taurus", "Gemini", "Cancer", "Leo", "Virgo", "Libra", "Scorpio", "Sagittarius", "Capricorn", "Aquarius", "Pisces"]
+
+# Системы домов и порог стационарности как в flatlib (HOUSES_DEFAULT = Alcabitus)
+HOUSE_SYSTEM = b'B'
+STATIONARY_SPEED = 0.0003
+
+# Прогрев: по карте на каждую дату открывает файлы ephe/, покрывающие основной диапазон дат
+WARMUP_YEARS = [1900, 1950, 2000, 2050, 2100]
+
+
+def get_sign_name(lon):
+    return SIGNS[int(lon // 30) % 12]
+
+
+def parse_date_time(date_raw, time_raw):
+    # "1990/05/17", "14:30" -> (1990, 5, 17, 14, 30)
+    year, month, day = (int(x) for x in date_raw.split('/'))
+    hour, minute = (int(x) for x in time_raw.split(':')[:2])
+    return year, month, day, hour, minute
+
+
+def make_chart(bodies, houses, asc, mc):
+    # bodies: [(имя, долгота, широта, скорость по долготе)] -> формат ответа /calculate
+    with metrics.stage("assemble"):
+        planets = []
+        for name, lon, lat, speed in bodies:
+            planets.append({
+                "name": name,
+                "angle": float(lon),
+                "sign": get_sign_name(lon),
+                "retrograde": bool(speed <= -STATIONARY_SPEED),
+                "speed": float(speed),
+                "lat": float(lat),
+                "lng": float(lon)
+            })
+        return {
+            "planets": planets,
+            "houses": [float(h) for h in houses],
+            "angles": {"Ascendant": float(asc), "MC": float(mc)}
+        }
+
+
+# --- SWISSEPH: ПРЯМЫЕ ВЫЗОВЫ calc_ut/houses ---
+class SwissephBackend:
+    name = "swisseph"
+
+    def __init__(self):
+        import swisseph
+        self.swe = swisseph
+        self.body_ids = [
+            swisseph.SUN, swisseph.MOON, swisseph.MERCURY, swisseph.VENUS, swisseph.MARS,
+            swisseph.JUPITER, swisseph.SATURN, swisseph.URANUS, swisseph.NEPTUNE, swisseph.PLUTO,
+            swisseph.CHIRON, swisseph.MEAN_NODE
+        ]
+        self.flags = swisseph.FLG_SWIEPH | swisseph.FLG_SPEED
+
+    def init_worker(self):
+        # Путь к файлам в swisseph хранится отдельно для каждого потока
+        self.swe.set_ephe_path(EPHE_PATH)
+
+    def julian_day(self, date_raw, time_raw):
+        with metrics.stage("parse"):
+            year, month, day, hour, minute = parse_date_time(date_raw, time_raw)
+            return self.swe.julday(year, month, day, hour + minute / 60.0)
+
+    def warm_up(self):
+        for year in WARMUP_YEARS:
+            SwissephBackend.calculate(self, f"{year}/01/01", "12:00", 0.0, 0.0)
+
+    def calculate(self, date_raw, time_raw, latitude, longitude):
+        jd = self.julian_day(date_raw, time_raw)
+        with metrics.stage("positions"):
+            bodies = []
+            for name, body_id in zip(BODY_NAMES, self.body_ids):
+                xx, _ = self.swe.calc_ut(jd, body_id, self.flags)
+                bodies.append((name, xx[0], xx[1], xx[3]))
+        with metrics.stage("houses"):
+            cusps, ascmc = self.swe.houses(jd, latitude, longitude, HOUSE_SYSTEM)
+        return make_chart(bodies, cusps[:12], ascmc[0], ascmc[1])
+
+
+# --- ТАБЛИЦЫ ЧЕБЫШЕВА (ephemeris_tables) + ДОМА ИЗ swisseph ---
+# Тела считаются по предрассчитанным таблицам (1900–2100), вне интервала — через swisseph.
+# Куспиды домов — чистая формула swe.houses без чтения файлов эфемерид.
+class TablesBackend(SwissephBackend):
+    name = "tables"
+
+    def __init__(self):
+        super().__init__()
+        from ephemeris_tables import PositionTables
+        self.tables = PositionTables()
+
+    def warm_up(self):
+        # Страницы таблиц в page cache + файлы swisseph для дат вне таблиц
+        self.tables.touch()
+        super().warm_up()
+
+    def calculate(self, date_raw, time_raw, latitude, longitude):
+        jd = self.julian_day(date_raw, time_raw)
+        with metrics.stage("positions"):
+            positions = self.tables.positions_at(jd)
+            bodies = [(name,) + positions[name] for name in BODY_NAMES]
+        with metrics.stage("houses"):
+            cusps, ascmc = self.swe.houses(jd, latitude, longitude, HOUSE_SYSTEM)
+        return make_chart(bodies, cusps[:12], ascmc[0], ascmc[1])
+
+
+# --- FLATLIB: ПОЛНЫЙ Chart, ОСТАВЛЕН ДЛЯ СВЕРКИ ---
+class FlatlibBackend:
+    name = "flatlib"
+
+    def __init__(self):
+        from flatlib import const
+        from flatlib.chart import Chart
+        from flatlib.datetime import Datetime
+        from flatlib.geopos import GeoPos
+        import swisseph
+        self.const, self.Chart, self.Datetime, self.GeoPos = const, Chart, Datetime, GeoPos
+        self.swe = swisseph
+        self.ids = [
+            const.SUN, const.MOON, const.MERCURY, const.VENUS, const.MARS,
+            const.JUPITER, const.SATURN, const.URANUS, const.NEPTUNE, const.PLUTO,
+            const.CHIRON, const.NORTH_NODE
+        ]
+
+    def init_worker(self):
+        # flatlib при импорте указывает на свой урезанный набор файлов, подменяем на ephe/
+        self.swe.set_ephe_path(EPHE_PATH)
+
+    def warm_up(self):
+        for year in WARMUP_YEARS:
+            self.calculate(f"{year}/01/01", "12:00", 0.0, 0.0)
+
+    def calculate(self, date_raw, time_raw, latitude, longitude):
+        const = self.const
+        with metrics.stage("parse"):
+            date = self.Datetime(date_raw, time_raw, '+00:00')
+            pos = self.GeoPos(latitude, longitude)
+        with metrics.stage("chart"):
+            # По умолчанию flatlib строит только традиционные планеты, поэтому список объектов задаем явно
+            chart = self.Chart(date, pos, IDs=const.LIST_OBJECTS)
+
+        with metrics.stage("lookup"):
+            bodies = []
+            for name, p_id in zip(BODY_NAMES, self.ids):
+                obj = chart.get(p_id)
+                bodies.append((name, obj.lon, obj.lat, obj.lonspeed))
+            houses = [chart.get(getattr(const, f'HOUSE{i}')).lon for i in range(1, 13)]
+            asc, mc = chart.get(const.ASC).lon, chart.get(const.MC).lon
+        return make_chart(bodies, houses, asc, mc)
+
+
+# --- EPHEM: ДЕГРАДИРОВАННЫЙ РЕЖИМ БЕЗ SWISS EPHEMERIS ---
+# Планеты в пределах 1′ от swisseph, Луна — до ~80″, куспиды — до ~70″ (test_chart_backends.py).
+# Хирона в ephem нет, поэтому в ответе его не будет; узел средний (формула Meeus),
+# дома Alcabitus считаются по звездному времени.
+class EphemBackend:
+    name = "ephem"
+
+    def __init__(self):
+        import ephem
+        self.ephem = ephem
+        self.body_classes = [
+            ("Sun", ephem.Sun), ("Moon", ephem.Moon), ("Mercury", ephem.Mercury),
+            ("Venus", ephem.Venus), ("Mars", ephem.Mars), ("Jupiter", ephem.Jupiter),
+            ("Saturn", ephem.Saturn), ("Uranus", ephem.Uranus), ("Neptune", ephem.Neptune),
+            ("Pluto", ephem.Pluto)
+        ]
+
+    def init_worker(self):
+        pass
+
+    def warm_up(self):
+        self.calculate("2000/01/01", "12:00", 0.0, 0.0)
+
+    def ecliptic_of_date(self, body, date):
+        ephem = self.ephem
+        body.compute(date, epoch=date)
+        eq = ephem.Equatorial(body.g_ra, body.g_dec, epoch=date)
+        ecl = ephem.Ecliptic(eq, epoch=date)
+        return math.degrees(ecl.lon), math.degrees(ecl.lat)
+
+    def calculate(self, date_raw, time_raw, latitude, longitude):
+        ephem = self.ephem
+        with metrics.stage("parse"):
+            year, month, day, hour, minute = parse_date_time(date_raw, time_raw)
+            date = ephem.Date((year, month, day, hour, minute, 0))
+
+        with metrics.stage("positions"):
+            bodies = []
+            for name, cls in self.body_classes:
+                body = cls()
+                lon, lat = self.ecliptic_of_date(body, date)
+                # Скорость: центральная разность за сутки
+                before, _ = self.ecliptic_of_date(body, ephem.Date(date - 0.5))
+                after, _ = self.ecliptic_of_date(body, ephem.Date(date + 0.5))
+                speed = (after - before + 180.0) % 360.0 - 180.0
+                bodies.append((name, lon % 360.0, lat, speed))
+
+            # Средний восходящий узел Луны (Meeus, гл. 47), скорость почти постоянна
+            t = (float(date) + 2415020.0 - 2451545.0) / 36525.0
+            node = 125.0445479 - 1934.1362891 * t + 0.0020754 * t * t + t ** 3 / 467441.0
+            bodies.append(("NNode", node % 360.0, 0.0, -1934.1362891 / 36525.0))
+
+        with metrics.stage("houses"):
+            observer = ephem.Observer()
+            observer.lat = str(latitude)
+            observer.lon = str(longitude)
+            observer.date = date
+            ramc = math.degrees(observer.sidereal_time())
+            obliquity = 23.4392911 - 0.0130042 * t
+            houses = alcabitus_houses(ramc, obliquity, latitude)
+        return make_chart(bodies, houses, houses[0], houses[9])
+
+
+def alcabitus_houses(ramc, obliquity, latitude):
+    # Дома Alcabitus: полудуги восходящего градуса делятся на три части по прямому восхождению
+    eps = math.radians(obliquity)
+    phi = math.radians(latitude)
+    r = math.radians(ramc)
+
+    asc = math.degrees(math.atan2(math.cos(r), -(math.sin(r) * math.cos(eps) + math.tan(phi) * math.sin(eps)))) % 360.0
+    decl = math.asin(math.sin(eps) * math.sin(math.radians(asc)))
+    ad = math.degrees(math.asin(max(-1.0, min(1.0, math.tan(phi) * math.tan(decl)))))
+    dsa = 90.0 + ad
+    nsa = 180.0 - dsa
+
+    def ecliptic_from_ra(ra):
+        ra = math.radians(ra)
+        return math.degrees(math.atan2(math.sin(ra), math.cos(ra) * math.cos(eps))) % 360.0
+
+    mc = ecliptic_from_ra(ramc)
+    h11 = ecliptic_from_ra(ramc + dsa / 3.0)
+    h12 = ecliptic_from_ra(ramc + 2.0 * dsa / 3.0)
+    h2 = ecliptic_from_ra(ramc + dsa + nsa / 3.0)
+    h3 = ecliptic_from_ra(ramc + dsa + 2.0 * nsa / 3.0)
+    first_half = [asc, h2, h3, (mc + 180.0) % 360.0, (h11 + 180.0) % 360.0, (h12 + 180.0) % 360.0]
+    return first_half + [(h + 180.0) % 360.0 for h in first_half[:3]] + [mc, h11, h12]
+
+
+BACKENDS = {
+    "tables": TablesBackend,
+    "swisseph": SwissephBackend,
+    "flatlib": FlatlibBackend,
+    "ephem": EphemBackend,
+}
+
+# Порядок автоматического выбора: самый быстрый первым, ephem как последний вариант
+AUTO_ORDER = ["tables", "swisseph", "flatlib", "ephem"]
+
+
+def select_backend(preferred="auto"):
+    names = AUTO_ORDER if preferred == "auto" else [preferred] + [n for n in AUTO_ORDER if n != preferred]
+    for name in names:
+        try:
+            backend = BACKENDS[name]()
+        except KeyError:
+            logger.error(f"Unknown chart backend: {name}")
+            continue
+        except Exception as e:
+            logger.error(f"Chart backend {name} unavailable: {e}")
+            continue
+        if name != names[0]:
+            logger.warning(f"Chart backend degraded to {name}")
+        logger.info(f"Chart backend: {name}")
+        return backend
+    logger.error("No chart backend available")
+    return None
+
+
+# --- СВЕРКА БЭКЕНДОВ ---
+def parity_report(samples=None):
+    # Максимальные расхождения (в градусах) каждого бэкенда с swisseph по телам и домам
+    samples = samples or [
+        ("1905/03/01", "06:15", 48.85, 2.35),
+        ("1950/07/20", "23:40", -33.87, 151.21),
+        ("1990/05/17", "14:30", 55.75, 37.6),
+        ("2024/12/31", "00:00", 40.71, -74.0),
+        ("2080/01/15", "12:00", 64.15, -21.94),
+    ]
+    reference = SwissephBackend()
+    reference.init_worker()
+    report = {}
+    for name in ["tables", "flatlib", "ephem"]:
+        try:
+            backend = BACKENDS[name]()
+        except Exception as e:
+            report[name] = f"unavailable: {e}"
+            continue
+        backend.init_worker()
+        worst = {}
+        for sample in samples:
+            expected = reference.calculate(*sample)
+            actual = backend.calculate(*sample)
+            actual_planets = {p["name"]: p for p in actual["planets"]}
+            pairs = [
+                (p["name"], p["angle"], actual_planets[p["name"]]["angle"])
+                for p in expected["planets"] if p["name"] in actual_planets
+            ]
+            pairs += [(f"House{i + 1}", a, b) for i, (a, b) in enumerate(zip(expected["houses"], actual["houses"]))]
+            for key, a, b in pairs:
+                diff = abs((a - b + 180.0) % 360.0 - 180.0)
+                worst[key] = max(worst.get(key, 0.0), diff)
+        report[name] = worst
+    return report
+
+
+if __name__ == "__main__":
+    for backend_name, result in parity_report().items():
+        print(backend_name)
+        if isinstance(result, str):
+            print(f"  {result}")
+            continue
+        for key, diff in result.items():
+            print(f"  {key:10s} {diff * 3600:10.2f}\"")
@@ -0,0 +1,191 @@
+import asyncio
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+# --- КЭШ ГОТОВЫХ КАРТ ---
+# Карта полностью определяется моментом рождения (с точностью до минуты) и координатами,
+# поэтому результат можно переиспользовать без обращения к эфемеридам.
+# Память: LRU на CHART_CACHE_SIZE записей. Диск (необязательно): SQLite-файл CHART_CACHE_DB,
+# чтобы прогретые записи переживали перезапуск дино.
+# Запись на диск идет в отдельном потоке пачками (одна транзакция на пачку), чтение с диска
+# из async-обработчиков — через get_async/get_many_async в потоке: event loop не ждет SQLite.
+
+WRITE_BATCH = 512
+READ_CHUNK = 500  # ключей в одном SELECT ... IN (лимит переменных SQLite)
+
+
+class ChartCache:
+    def __init__(self, max_entries=4096, db_path=None):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_lock = threading.Lock()  # соединение SQLite общее для читателей и писателя
+        self._pending = queue.Queue()
+        self._writer = None
+        if db_path:
+            self._open_db(db_path)
+
+    def _open_db(self, db_path):
+        try:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            # В WAL при NORMAL fsync только на контрольных точках; потеря последних записей кэша не страшна
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS charts (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._writer = threading.Thread(target=self._write_loop, name="chart-cache-writer", daemon=True)
+            self._writer.start()
+            logger.info(f"Chart cache disk tier: {db_path}")
+        except sqlite3.Error as e:
+            # Без диска кэш продолжает работать в памяти
+            logger.error(f"Chart cache disk tier disabled: {e}")
+            self._db = None
+
+    def get(self, key):
+        value = self._memory_get(key)
+        if value is None:
+            value = self._disk_get(key)
+        return value
+
+    async def get_async(self, key):
+        value = self._memory_get(key)
+        if value is None:
+            value = await asyncio.to_thread(self._disk_get, key) if self._db is not None else self._disk_get(key)
+        return value
+
+    async def get_many_async(self, keys):
+        # -> {ключ: карта} для найденных; промахи памяти читаются с диска одним запросом в потоке
+        found, missing = {}, []
+        for key in keys:
+            value = self._memory_get(key)
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing:
+            found.update(await asyncio.to_thread(self._disk_get_many, missing) if self._db is not None else self._disk_get_many(missing))
+        return found
+
+    def put(self, key, value):
+        self.put_many([(key, value)])
+
+    def put_many(self, items):
+        with self._lock:
+            for key, value in items:
+                self._remember(key, value)
+        if self._db is not None:
+            for item in items:
+                self._pending.put(item)
+
+    def flush(self):
+        # Дождаться записи всего, что стоит в очереди (при остановке приложения)
+        if self._db is not None:
+            self._pending.join()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "disk": self._db is not None,
+                "disk_pending": self._pending.qsize(),
+            }
+
+    def _memory_get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return value
+
+    def _remember(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _disk_get(self, key):
+        return self._disk_get_many([key]).get(key)
+
+    def _disk_get_many(self, keys):
+        found = {}
+        if self._db is not None:
+            try:
+                with self._db_lock:
+                    for i in range(0, len(keys), READ_CHUNK):
+                        chunk = keys[i:i + READ_CHUNK]
+                        rows = self._db.execute(
+                            f"SELECT key, value FROM charts WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                        ).fetchall()
+                        found.update((key, value) for key, value in rows)
+            except sqlite3.Error as e:
+                logger.error(f"Chart cache read error: {e}")
+            found = {key: json.loads(value) for key, value in found.items()}
+
+        with self._lock:
+            for key, value in found.items():
+                self._remember(key, value)
+            self.disk_hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def _write_loop(self):
+        while True:
+            batch = [self._pending.get()]
+            while len(batch) < WRITE_BATCH:
+                try:
+                    batch.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                rows = [(key, json.dumps(value, separators=(",", ":"))) for key, value in batch]
+                with self._db_lock:
+                    with self._db:
+                        self._db.execute("BEGIN")
+                        self._db.executemany("INSERT OR REPLACE INTO charts (key, value) VALUES (?, ?)", rows)
+            except sqlite3.Error as e:
+                logger.error(f"Chart cache write error: {e}")
+            finally:
+                for _ in batch:
+                    self._pending.task_done()
+
+
+def chart_cache_key(moment, latitude, longitude, precision):
+    # Ключ: разобранный момент (datetime) с точностью до минуты — одинаковый для "1990-5-17" и
+    # "1990-05-17", — и координаты, округленные до precision знаков
+    return f"{moment:%Y/%m/%d %H:%M}|{latitude:.{precision}f}|{longitude:.{precision}f}"
+
+
+def quantize(value, precision):
+    # + 0.0 убирает "-0.0", иначе одна и та же точка даст два разных ключа
+    return round(value, precision) + 0.0
+
+
+CHART_CACHE_PRECISION = int(os.environ.get("CHART_CACHE_PRECISION", 4))
+
+chart_cache = ChartCache(
+    max_entries=int(os.environ.get("CHART_CACHE_SIZE", 4096)),
+    db_path=os.environ.get("CHART_CACHE_DB") or None,
+)
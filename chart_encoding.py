@@ -0,0 +1,111 @@
+import hashlib
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# --- КОДИРОВАНИЕ ОТВЕТА /calculate ---
+# Формат выбирается по заголовку Accept:
+#   application/json                   — исходный формат (список словарей по планетам)
+#   application/vnd.natal.compact+json — колоночный: по массиву на поле, без дубля lng
+#   application/msgpack                — тот же колоночный формат в MessagePack
+# Карта однозначно определяется нормализованным вводом (ключ кэша, в нем есть и имя бэкенда),
+# поэтому сильный ETag считается из ключа и формата без расчета: на If-None-Match с тем же
+# тегом сразу отдается 304.
+# orjson и msgpack необязательны: без orjson JSON собирается стандартным json,
+# без msgpack формат MessagePack не предлагается.
+
+VERBOSE = "application/json"
+COMPACT = "application/vnd.natal.compact+json"
+MSGPACK = "application/msgpack"
+
+# Версия содержимого ответа: меняется при изменении формата или точности, чтобы сбросить старые ETag
+FORMAT_VERSION = "1"
+# Знаков после запятой в компактном формате: 1e-6° ≈ 0.004″, точнее самих таблиц
+COMPACT_DIGITS = 6
+
+MEDIA_ALIASES = {"application/x-msgpack": MSGPACK}
+
+
+def supported_encodings():
+    return [VERBOSE, COMPACT] + ([MSGPACK] if msgpack is not None else [])
+
+
+def negotiate(accept):
+    # Заголовок Accept -> медиатип ответа. Берем поддерживаемый тип с наибольшим q
+    # (при равенстве — в порядке заголовка); без подходящего — исходный JSON
+    if not accept:
+        return VERBOSE
+    supported = supported_encodings()
+    best, best_q = VERBOSE, 0.0
+    for part in accept.split(","):
+        media, _, params = part.strip().partition(";")
+        media = MEDIA_ALIASES.get(media.strip().lower(), media.strip().lower())
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if media in supported and q > best_q:
+            best, best_q = media, q
+    return best
+
+
+def compact_chart(chart):
+    # Колоночный формат: имена тел один раз, дальше массивы значений в том же порядке
+    planets = chart["planets"]
+
+    def column(field):
+        return [round(p[field], COMPACT_DIGITS) for p in planets]
+
+    return {
+        "bodies": [p["name"] for p in planets],
+        "lon": column("angle"),
+        "lat": column("lat"),
+        "speed": column("speed"),
+        "sign": [p["sign"] for p in planets],
+        "retrograde": [p["retrograde"] for p in planets],
+        "houses": [round(h, COMPACT_DIGITS) for h in chart["houses"]],
+        "angles": {name: round(value, COMPACT_DIGITS) for name, value in chart["angles"].items()},
+    }
+
+
+def dumps(value):
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def encode_chart(chart, encoding):
+    # -> (тело ответа, Content-Type)
+    if encoding == MSGPACK:
+        return msgpack.packb(compact_chart(chart), use_bin_type=True), MSGPACK
+    if encoding == COMPACT:
+        return dumps(compact_chart(chart)), COMPACT
+    return dumps(chart), VERBOSE
+
+
+def chart_etag(key, encoding):
+    digest = hashlib.sha256(f"{FORMAT_VERSION}:{encoding}:{key}".encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def etag_matches(if_none_match, etag):
+    # If-None-Match использует слабое сравнение: префикс W/ не учитывается
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
@@ -0,0 +1,15 @@
+import os
+
+import pytest
+
+# Тесты не ходят в Gemini: модель заменяется локальной заглушкой (см. llm.StubModel)
+os.environ.setdefault("LLM_STUB", "1")
+os.environ.setdefault("LLM_STUB_DELAY", "0.01")
+
+
+@pytest.fixture(scope="module")
+def client():
+    from fastapi.testclient import TestClient
+    import main
+    with TestClient(main.app) as test_client:
+        yield test_client
@@ -0,0 +1,293 @@
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+from chart_backends import BODY_NAMES, EPHE_PATH
+
+logger = logging.getLogger(__name__)
+
+TABLES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tables")
+
+# --- ТАБЛИЦЫ ПОЛОЖЕНИЙ (ЧЕБЫШЕВ) ---
+# Для каждого тела интервал делится на сегменты длиной seg_days, внутри сегмента долгота и
+# широта приближаются рядом Чебышева степени degree. Коэффициенты производной долготы
+# хранятся рядом, чтобы скорость (и ретроградность) тоже считалась одной формулой.
+# Файл тела: tables/<Body>.npy формы (сегменты, 3, degree + 1) — lon, lat, d(lon)/dx.
+# Файлы открываются через mmap, поэтому все воркеры делят одни и те же страницы page cache.
+#
+# Гарантия точности (проверяется при сборке, см. meta.json): долгота и широта не хуже
+# ERROR_BOUND_ARCSEC угловых секунд относительно Swiss Ephemeris внутри покрытого интервала.
+# Исключение — планета в пределах ~1° от Солнца: swisseph добавляет гравитационное отклонение
+# света Солнцем, которое там скачкообразно и не аппроксимируется рядом. Таблицы строятся без
+# него (FLG_NOGDEFL), поэтому у соединения с Солнцем расхождение достигает нескольких секунд.
+# Вне интервала запросы уходят в swisseph.
+
+ERROR_BOUND_ARCSEC = 0.5
+CONJUNCTION_ELONGATION = 1.0
+
+# Тело -> (длина сегмента в сутках, степень ряда)
+TABLE_LAYOUT = {
+    "Sun": (32, 12),
+    "Moon": (8, 14),
+    "Mercury": (16, 14),
+    "Venus": (32, 12),
+    "Mars": (32, 12),
+    "Jupiter": (32, 10),
+    "Saturn": (32, 10),
+    "Uranus": (32, 10),
+    "Neptune": (32, 10),
+    "Pluto": (32, 10),
+    "Chiron": (32, 10),
+    "NNode": (32, 10),
+}
+
+DEFAULT_START_YEAR = 1900
+DEFAULT_END_YEAR = 2100
+
+
+def swe_body_ids(swe):
+    return dict(zip(BODY_NAMES, [
+        swe.SUN, swe.MOON, swe.MERCURY, swe.VENUS, swe.MARS, swe.JUPITER, swe.SATURN,
+        swe.URANUS, swe.NEPTUNE, swe.PLUTO, swe.CHIRON, swe.MEAN_NODE
+    ]))
+
+
+def chebyshev_nodes(degree):
+    # Узлы Чебышева первого рода на [-1, 1]
+    n = degree + 1
+    theta = np.pi * (np.arange(n) + 0.5) / n
+    return np.cos(theta), theta
+
+
+def chebyshev_fit(values, theta):
+    # values: (..., n) в узлах -> коэффициенты (..., n) через дискретное косинус-преобразование
+    n = theta.shape[0]
+    basis = np.cos(np.outer(theta, np.arange(n)))  # (узел, k)
+    coeffs = values @ basis * (2.0 / n)
+    coeffs[..., 0] *= 0.5
+    return coeffs
+
+
+def chebyshev_derivative(coeffs):
+    # Коэффициенты производной ряда по x той же длины (старший коэффициент нулевой)
+    n = coeffs.shape[-1]
+    der = np.zeros_like(coeffs)
+    for k in range(n - 2, -1, -1):
+        der[..., k] = 2.0 * (k + 1) * coeffs[..., k + 1] + (der[..., k + 2] if k + 2 < n else 0.0)
+    der[..., 0] *= 0.5
+    return der
+
+
+def clenshaw(coeffs, x):
+    # coeffs: (m, n), x: (m,) -> значения рядов в точках, по одной строке коэффициентов на точку
+    b1 = np.zeros_like(x)
+    b2 = np.zeros_like(x)
+    for k in range(coeffs.shape[-1] - 1, 0, -1):
+        b1, b2 = 2.0 * x * b1 - b2 + coeffs[:, k], b1
+    return x * b1 - b2 + coeffs[:, 0]
+
+
+def clenshaw_one(coeffs, x):
+    b1 = b2 = 0.0
+    for c in coeffs[:0:-1]:
+        b1, b2 = 2.0 * x * b1 - b2 + c, b1
+    return x * b1 - b2 + coeffs[0]
+
+
+# --- СБОРКА (ОФЛАЙН) ---
+def sample_body(swe, body_id, jds, flags=None):
+    if flags is None:
+        flags = swe.FLG_SWIEPH | swe.FLG_SPEED
+    # -> (..., 3): долгота, широта, скорость по долготе
+    out = np.empty((jds.size, 3))
+    for i, jd in enumerate(jds.ravel()):
+        xx, _ = swe.calc_ut(float(jd), body_id, flags)
+        out[i] = xx[0], xx[1], xx[3]
+    return out.reshape(jds.shape + (3,))
+
+
+def build_tables(directory=TABLES_PATH, start_year=DEFAULT_START_YEAR, end_year=DEFAULT_END_YEAR, check_points=2000):
+    import swisseph as swe
+    swe.set_ephe_path(EPHE_PATH)
+    os.makedirs(directory, exist_ok=True)
+
+    start_jd = swe.julday(start_year, 1, 1, 0.0)
+    end_jd = swe.julday(end_year, 12, 31, 24.0)
+    body_ids = swe_body_ids(swe)
+    rng = np.random.default_rng(0)
+    meta = {"start_jd": start_jd, "end_jd": end_jd, "error_bound_arcsec": ERROR_BOUND_ARCSEC, "bodies": {}}
+
+    for name in BODY_NAMES:
+        seg_days, degree = TABLE_LAYOUT[name]
+        segments = int(np.ceil((end_jd - start_jd) / seg_days))
+        x, theta = chebyshev_nodes(degree)
+        seg_start = start_jd + seg_days * np.arange(segments)
+        jds = seg_start[:, None] + (x[None, :] + 1.0) * (seg_days / 2.0)
+
+        samples = sample_body(swe, body_ids[name], jds, swe.FLG_SWIEPH | swe.FLG_NOGDEFL | swe.FLG_SPEED)
+        lon = np.unwrap(samples[..., 0], period=360.0, axis=1)
+        lat = samples[..., 1]
+
+        table = np.empty((segments, 3, degree + 1))
+        table[:, 0] = chebyshev_fit(lon, theta)
+        table[:, 1] = chebyshev_fit(lat, theta)
+        table[:, 2] = chebyshev_derivative(table[:, 0])
+        np.save(os.path.join(directory, f"{name}.npy"), table)
+
+        # Проверка в случайных точках против swisseph с обычными флагами (как в SwissephBackend),
+        # не считая моментов, когда тело ближе CONJUNCTION_ELONGATION к Солнцу
+        probe = rng.uniform(start_jd, end_jd, check_points)
+        engine = BodyTable(table, start_jd, seg_days)
+        got_lon, got_lat, got_speed = engine.evaluate(probe)
+        expected = sample_body(swe, body_ids[name], probe)
+        sun = sample_body(swe, swe.SUN, probe)
+        elongation = np.abs((expected[:, 0] - sun[:, 0] + 180.0) % 360.0 - 180.0)
+        far = elongation > CONJUNCTION_ELONGATION if name != "Sun" else np.ones(probe.size, bool)
+        lon_err = np.abs((got_lon - expected[:, 0] + 180.0) % 360.0 - 180.0)[far].max() * 3600.0
+        lat_err = np.abs(got_lat - expected[:, 1])[far].max() * 3600.0
+        speed_err = np.abs(got_speed - expected[:, 2])[far].max()
+        meta["bodies"][name] = {
+            "seg_days": seg_days,
+            "degree": degree,
+            "max_lon_error_arcsec": float(lon_err),
+            "max_lat_error_arcsec": float(lat_err),
+            "max_speed_error_deg_per_day": float(speed_err),
+        }
+        if max(lon_err, lat_err) > ERROR_BOUND_ARCSEC:
+            logger.warning(f"{name}: table error {max(lon_err, lat_err):.3f}\" exceeds {ERROR_BOUND_ARCSEC}\"")
+        logger.info(f"{name}: {segments} segments, lon {lon_err:.4f}\", lat {lat_err:.4f}\", speed {speed_err:.2e}")
+
+    with open(os.path.join(directory, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+# --- РАСЧЕТ ПО ТАБЛИЦАМ (РАНТАЙМ) ---
+class BodyTable:
+    def __init__(self, table, start_jd, seg_days):
+        self.table = table
+        self.start_jd = start_jd
+        self.seg_days = seg_days
+        self.end_jd = start_jd + seg_days * table.shape[0]
+
+    def evaluate(self, jds):
+        # jds: массив моментов внутри интервала -> (долгота, широта, скорость в градусах в сутки)
+        offset = (jds - self.start_jd) / self.seg_days
+        seg = np.clip(offset.astype(np.int64), 0, self.table.shape[0] - 1)
+        x = 2.0 * (offset - seg) - 1.0
+        coeffs = self.table[seg]
+        lon = clenshaw(coeffs[:, 0], x) % 360.0
+        lat = clenshaw(coeffs[:, 1], x)
+        speed = clenshaw(coeffs[:, 2], x) * (2.0 / self.seg_days)
+        return lon, lat, speed
+
+    def evaluate_one(self, jd):
+        # Скалярный вариант для одной карты: на 1 точке накладные расходы numpy больше самой арифметики
+        offset = (jd - self.start_jd) / self.seg_days
+        seg = min(max(int(offset), 0), self.table.shape[0] - 1)
+        x = 2.0 * (offset - seg) - 1.0
+        lon_c, lat_c, der_c = self.table[seg].tolist()
+        return clenshaw_one(lon_c, x) % 360.0, clenshaw_one(lat_c, x), clenshaw_one(der_c, x) * (2.0 / self.seg_days)
+
+
+class SwissephPositions:
+    # Тот же интерфейс, что у PositionTables, но каждая точка считается через swisseph.
+    # Используется для дат вне таблиц и целиком, если таблицы не загрузились.
+    def __init__(self):
+        self._swe_threads = threading.local()
+        self._swe()
+
+    def positions(self, jds, bodies=BODY_NAMES):
+        jds = np.asarray(jds, dtype=float)
+        return {name: tuple(v.reshape(jds.shape) for v in self.sample(name, jds.ravel())) for name in bodies}
+
+    def positions_at(self, jd, bodies=BODY_NAMES):
+        return {name: tuple(float(v[0]) for v in self.sample(name, np.array([jd]))) for name in bodies}
+
+    def sample(self, name, jds):
+        swe = self._swe()
+        out = sample_body(swe, swe_body_ids(swe)[name], jds, swe.FLG_SWIEPH | swe.FLG_SPEED)
+        return out[:, 0], out[:, 1], out[:, 2]
+
+    def _swe(self):
+        # Путь к файлам в swisseph задается отдельно для каждого потока
+        swe = getattr(self._swe_threads, "swe", None)
+        if swe is None:
+            import swisseph as swe
+            swe.set_ephe_path(EPHE_PATH)
+            self._swe_threads.swe = swe
+        return swe
+
+
+class PositionTables:
+    def __init__(self, directory=TABLES_PATH):
+        with open(os.path.join(directory, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.start_jd = self.meta["start_jd"]
+        self.end_jd = self.meta["end_jd"]
+        self.bodies = {}
+        for name, info in self.meta["bodies"].items():
+            table = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+            self.bodies[name] = BodyTable(table, self.start_jd, info["seg_days"])
+        self._fallback = None
+
+    def covers(self, jds):
+        jds = np.asarray(jds, dtype=float)
+        return (jds >= self.start_jd) & (jds < self.end_jd)
+
+    def positions(self, jds, bodies=BODY_NAMES):
+        # Векторный запрос: {тело: (lon, lat, speed)} массивами той же формы, что jds.
+        # Точки вне покрытого интервала досчитываются через swisseph.
+        jds = np.asarray(jds, dtype=float)
+        flat = jds.ravel()
+        inside = self.covers(flat)
+        result = {}
+        for name in bodies:
+            lon = np.empty(flat.shape)
+            lat = np.empty(flat.shape)
+            speed = np.empty(flat.shape)
+            if inside.any():
+                lon[inside], lat[inside], speed[inside] = self.bodies[name].evaluate(flat[inside])
+            if not inside.all():
+                lon[~inside], lat[~inside], speed[~inside] = self._swisseph(name, flat[~inside])
+            result[name] = (lon.reshape(jds.shape), lat.reshape(jds.shape), speed.reshape(jds.shape))
+        return result
+
+    def touch(self):
+        # Прочитать таблицы целиком, чтобы первые запросы не ждали подгрузки страниц с диска
+        return sum(float(np.sum(body.table)) for body in self.bodies.values())
+
+    def positions_at(self, jd, bodies=BODY_NAMES):
+        # Одна точка: {тело: (lon, lat, speed)} числами
+        if not self.start_jd <= jd < self.end_jd:
+            return {name: tuple(float(v[0]) for v in self._swisseph(name, np.array([jd]))) for name in bodies}
+        return {name: self.bodies[name].evaluate_one(jd) for name in bodies}
+
+    def _swisseph(self, name, jds):
+        if self._fallback is None:
+            self._fallback = SwissephPositions()
+        return self._fallback.sample(name, jds)
+
+
+def open_positions(directory=TABLES_PATH):
+    # Таблицы, а если они не загрузились — swisseph с тем же интерфейсом positions()
+    try:
+        return PositionTables(directory)
+    except Exception as e:
+        logger.error(f"Position tables unavailable ({e}), sampling swisseph instead")
+        return SwissephPositions()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build Chebyshev position tables from the bundled ephemeris")
+    parser.add_argument("--out", default=TABLES_PATH)
+    parser.add_argument("--start-year", type=int, default=DEFAULT_START_YEAR)
+    parser.add_argument("--end-year", type=int, default=DEFAULT_END_YEAR)
+    args = parser.parse_args()
+    build_tables(args.out, args.start_year, args.end_year)
@@ -0,0 +1,314 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# --- АСИНХРОННЫЙ КЛИЕНТ GEMINI ---
+# Вызовы модели не блокируют event loop: одновременно идет не больше LLM_CONCURRENCY
+# запросов, каждый ограничен LLM_TIMEOUT секундами. Одинаковые промпты, которые уже в работе,
+# ждут один общий вызов, а готовые ответы кэшируются по хэшу промпта на LLM_CACHE_TTL секунд
+# (гороскопы на дату для одного и того же набора данных повторяются постоянно).
+# LLM_STUB=1 подменяет Gemini локальной заглушкой — для тестов и нагрузочных прогонов.
+
+DEFAULT_MODEL = 'gemini-1.5-flash'
+# Ключ только из окружения: без него модель не выбирается, эндпоинты отдают запасной текст, /ready — 503
+GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
+# Сколько ждать list_models при старте, прежде чем взять модель по умолчанию
+DISCOVERY_TIMEOUT = float(os.environ.get("LLM_DISCOVERY_TIMEOUT", 20))
+
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubStream:
+    def __init__(self, chunks, delay):
+        self._chunks = list(chunks)
+        self._delay = delay
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._chunks:
+            raise StopAsyncIteration
+        await asyncio.sleep(self._delay)
+        return StubResponse(self._chunks.pop(0))
+
+
+class StubModel:
+    # Повторяет нужную часть интерфейса genai.GenerativeModel
+    def __init__(self, delay=None):
+        self.model_name = "stub"
+        self.delay = float(os.environ.get("LLM_STUB_DELAY", 0.05)) if delay is None else delay
+        self.calls = 0
+
+    def reply(self, prompt):
+        return f"[stub] {prompt}"
+
+    def generate_content(self, prompt, stream=False):
+        self.calls += 1
+        time.sleep(self.delay)
+        return StubResponse(self.reply(prompt))
+
+    async def generate_content_async(self, prompt, stream=False):
+        self.calls += 1
+        text = self.reply(prompt)
+        if stream:
+            words = text.split(" ")
+            return StubStream([w + " " for w in words[:-1]] + words[-1:], self.delay / max(len(words), 1))
+        await asyncio.sleep(self.delay)
+        return StubResponse(text)
+
+
+def default_model():
+    if os.environ.get("LLM_STUB"):
+        return StubModel()
+    if not GEMINI_API_KEY:
+        return None
+    import google.generativeai as genai
+    genai.configure(api_key=GEMINI_API_KEY)
+    return genai.GenerativeModel(DEFAULT_MODEL)
+
+
+def discover_model():
+    # Первая модель с generateContent, иначе модель по умолчанию.
+    # google.generativeai импортируется только здесь: сам импорт занимает около полсекунды.
+    if os.environ.get("LLM_STUB"):
+        return StubModel()
+    if not GEMINI_API_KEY:
+        logger.error("GEMINI_API_KEY is not set, LLM disabled")
+        return None
+
+    import google.generativeai as genai
+    genai.configure(api_key=GEMINI_API_KEY)
+    try:
+        for m in genai.list_models():
+            if 'generateContent' in m.supported_generation_methods:
+                return genai.GenerativeModel(m.name)
+    except Exception as e:
+        logger.error(f"Model discovery failed: {e}")
+    return genai.GenerativeModel(DEFAULT_MODEL)
+
+
+class LLMClient:
+    def __init__(self, concurrency=4, timeout=30.0, cache_ttl=3600.0, cache_size=1024):
+        self.model = None
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.uncached = 0
+        self.concurrency = concurrency
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._cache = OrderedDict()  # хэш промпта -> (истекает, текст)
+        self._inflight = {}  # хэш промпта -> asyncio.Task
+        self._streams = {}  # хэш промпта -> StreamBuffer генерируемого потока
+        self._producers = set()  # задачи, читающие потоки модели
+
+    async def discover(self):
+        # Семафор создается заново в event loop приложения
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._inflight = {}
+        self._streams = {}
+        # list_models ходит в сеть синхронно, поэтому выполняется в отдельном потоке
+        try:
+            self.model = await asyncio.wait_for(asyncio.to_thread(discover_model), DISCOVERY_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error(f"Model discovery timed out after {DISCOVERY_TIMEOUT}s, using {DEFAULT_MODEL}")
+            self.model = await asyncio.to_thread(default_model)
+        logger.info(f"LLM model: {getattr(self.model, 'model_name', self.model)}")
+        return self.model
+
+    async def generate(self, prompt, cache=True):
+        if not cache:
+            # Промпт не зависит от входных данных: каждый вызов получает свой ответ,
+            # без кэша и без объединения одинаковых запросов
+            self.uncached += 1
+            return await self._complete(prompt)
+
+        key = prompt_key(prompt)
+        cached = self._cache_get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._generate(key, prompt))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # shield: отмена одного ожидающего клиента не отменяет общий вызов для остальных
+        return await asyncio.shield(task)
+
+    async def stream(self, prompt, cache=True):
+        # Асинхронный генератор кусков текста; готовый ответ из кэша отдается одним куском.
+        # Ответ модели читает отдельная задача в общий буфер (StreamBuffer): семафор занят только
+        # на время генерации, а не пока медленный клиент дочитывает SSE. Одинаковые промпты,
+        # которые уже генерируются, читают тот же буфер (при cache=False — нет, у каждого свой).
+        key = prompt_key(prompt)
+        cached = self._cache_get(key) if cache else None
+        if cached is not None:
+            self.hits += 1
+            yield cached
+            return
+
+        buffer = self._streams.get(key) if cache else None
+        if buffer is not None:
+            self.coalesced += 1
+        else:
+            if cache:
+                self.misses += 1
+            else:
+                self.uncached += 1
+            buffer = StreamBuffer()
+            task = asyncio.create_task(self._produce(prompt, buffer, key if cache else None))
+            self._producers.add(task)
+            task.add_done_callback(self._producers.discard)
+            if cache:
+                self._streams[key] = buffer
+                task.add_done_callback(lambda _: self._streams.pop(key, None))
+
+        async for chunk in buffer.read():
+            yield chunk
+
+    def stats(self):
+        return {
+            "model": getattr(self.model, "model_name", None),
+            "cache_entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "uncached": self.uncached,
+            "inflight": len(self._inflight) + len(self._streams),
+        }
+
+    async def _generate(self, key, prompt):
+        text = await self._complete(prompt)
+        self._cache_put(key, text)
+        return text
+
+    async def _complete(self, prompt):
+        async with self._semaphore:
+            with metrics.stage("llm"):
+                if hasattr(self.model, "generate_content_async"):
+                    response = await asyncio.wait_for(self.model.generate_content_async(prompt), self.timeout)
+                    text = response.text
+                else:
+                    text = await asyncio.wait_for(asyncio.to_thread(self._call_sync, prompt), self.timeout)
+        return text
+
+    async def _produce(self, prompt, buffer, key):
+        parts = []
+        try:
+            async with self._semaphore:
+                started = time.perf_counter()
+                if hasattr(self.model, "generate_content_async"):
+                    response = await asyncio.wait_for(self.model.generate_content_async(prompt, stream=True), self.timeout)
+                    iterator = response.__aiter__()
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(iterator.__anext__(), self.timeout)
+                        except StopAsyncIteration:
+                            break
+                        parts.append(chunk.text)
+                        buffer.append(chunk.text)
+                else:
+                    text = await asyncio.wait_for(asyncio.to_thread(self._call_sync, prompt), self.timeout)
+                    parts.append(text)
+                    buffer.append(text)
+                metrics.observe("stage_duration_seconds", time.perf_counter() - started, stage="llm_stream")
+        except Exception as e:
+            buffer.finish(e)
+            return
+        buffer.finish()
+        if key is not None:
+            self._cache_put(key, "".join(parts))
+
+    def _call_sync(self, prompt):
+        return self.model.generate_content(prompt).text
+
+    def _cache_get(self, key):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        expires, text = entry
+        if expires < time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return text
+
+    def _cache_put(self, key, text):
+        if self.cache_ttl <= 0:
+            return
+        self._cache[key] = (time.monotonic() + self.cache_ttl, text)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+
+class StreamBuffer:
+    # Куски ответа модели по мере поступления; каждый читатель идет по буферу в своем темпе
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self._changed = asyncio.Event()
+
+    def append(self, chunk):
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, error=None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    def _notify(self):
+        # Ожидающие держат ссылку на старое событие, новые ждут следующего
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def read(self):
+        position = 0
+        while True:
+            while position < len(self.chunks):
+                yield self.chunks[position]
+                position += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+
+def prompt_key(prompt):
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def sse_event(text, event=None):
+    # Server-Sent Events: многострочный текст передается несколькими строками data:
+    lines = [f"event: {event}"] if event else []
+    lines += [f"data: {line}" for line in text.split("\n")]
+    return "\n".join(lines) + "\n\n"
+
+
+llm = LLMClient(
+    concurrency=int(os.environ.get("LLM_CONCURRENCY", 4)),
+    timeout=float(os.environ.get("LLM_TIMEOUT", 30)),
+    cache_ttl=float(os.environ.get("LLM_CACHE_TTL", 6 * 3600)),
+    cache_size=int(os.environ.get("LLM_CACHE_SIZE", 1024)),
+)
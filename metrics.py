@@ -0,0 +1,108 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# --- МЕТРИКИ (ФОРМАТ PROMETHEUS) ---
+# Гистограммы задержек по эндпоинтам и по этапам обработки (разбор даты, расчет положений,
+# дома, сборка ответа, кэш, пул, сериализация, вызовы модели) плюс значения, которые
+# снимаются в момент запроса /metrics (статистика кэшей, очередь пула).
+# Этапы внутри расчета карты пишутся в том процессе, где идет расчет: при CHART_POOL=process
+# они остаются в процессах-воркерах, и в /metrics видно только время этапа "pool" целиком.
+
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKET_LABELS = [repr(b) for b in BUCKETS] + ["+Inf"]
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последняя корзина — +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    def __init__(self):
+        self._histograms = {}  # (имя, метки) -> Histogram
+        self._help = {}
+        self._collectors = []  # (имя, тип, описание, функция -> {метки: значение})
+        self._lock = threading.Lock()
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def stage(self, stage):
+        return self.timer("stage_duration_seconds", stage=stage)
+
+    def collect(self, name, kind, text, func):
+        # func() -> {кортеж пар (метка, значение): число}; вызывается при каждом /metrics
+        self._collectors.append((name, kind, text, func))
+
+    def histograms(self, name):
+        # [(метки, Histogram)] одной метрики — для отчетов bench.py
+        with self._lock:
+            return [(dict(labels), h) for (n, labels), h in sorted(self._histograms.items()) if n == name]
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def render(self):
+        lines = []
+        with self._lock:
+            items = sorted(self._histograms.items())
+            by_name = {}
+            for (name, labels), histogram in items:
+                by_name.setdefault(name, []).append((labels, histogram.counts[:], histogram.sum, histogram.count))
+
+        for name, series in by_name.items():
+            lines.append(f"# HELP {name} {self._help.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, counts, total, count in series:
+                cumulative = 0
+                for bound, c in zip(BUCKET_LABELS, counts):
+                    cumulative += c
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(labels)} {total:.6f}")
+                lines.append(f"{name}_count{format_labels(labels)} {count}")
+
+        for name, kind, text, func in self._collectors:
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in func().items():
+                lines.append(f"{name}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+
+metrics = Metrics()
+metrics.describe("http_request_duration_seconds", "Request latency by endpoint and status")
+metrics.describe("stage_duration_seconds", "Latency of request processing stages")
@@ -0,0 +1,194 @@
+import logging
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+from chart_backends import BODY_NAMES
+
+logger = logging.getLogger(__name__)
+
+# --- СИНАСТРИЯ ---
+# Карта сводится к вектору долгот точек (POINTS) и 12 куспидам домов. Межкартовые аспекты
+# считаются сразу для всех пар точек и всех аспектов как операции над массивами:
+# (точки A) x (точки B) x (аспекты). В режиме "один ко многим" то же самое идет по блокам
+# из хранилища ChartStore, где карты лежат в плотных массивах float32, а не списками словарей.
+
+POINTS = BODY_NAMES + ["Ascendant", "MC"]
+
+# Аспект -> (угол, орбис)
+ASPECTS = {
+    "conjunction": (0.0, 8.0),
+    "sextile": (60.0, 4.0),
+    "square": (90.0, 6.0),
+    "trine": (120.0, 7.0),
+    "opposition": (180.0, 8.0),
+}
+ASPECT_NAMES = list(ASPECTS)
+ASPECT_ANGLES = np.array([ASPECTS[a][0] for a in ASPECT_NAMES], dtype=np.float32)
+ASPECT_ORBS = np.array([ASPECTS[a][1] for a in ASPECT_NAMES], dtype=np.float32)
+
+# Веса по умолчанию: гармоничные аспекты в плюс, напряженные в минус
+DEFAULT_ASPECT_WEIGHTS = {"conjunction": 1.0, "sextile": 0.8, "square": -0.7, "trine": 1.0, "opposition": -0.5}
+DEFAULT_POINT_WEIGHTS = {
+    "Sun": 1.0, "Moon": 1.0, "Mercury": 0.6, "Venus": 1.0, "Mars": 0.9, "Jupiter": 0.5,
+    "Saturn": 0.6, "Uranus": 0.3, "Neptune": 0.3, "Pluto": 0.3, "Chiron": 0.2, "NNode": 0.3,
+    "Ascendant": 0.8, "MC": 0.4,
+}
+
+RANK_CHUNK = int(os.environ.get("SYNASTRY_RANK_CHUNK", 1024))
+
+
+def chart_vectors(chart):
+    # Ответ /calculate -> (долготы POINTS, куспиды)
+    by_name = {p["name"]: p["angle"] for p in chart["planets"]}
+    by_name.update(chart["angles"])
+    # Точки, которых нет в карте (Хирон в ephem), помечаются NaN и в аспектах не участвуют
+    lon = np.array([by_name.get(name, np.nan) for name in POINTS], dtype=np.float32)
+    return lon, np.array(chart["houses"], dtype=np.float32)
+
+
+def weights(aspect_weights=None, point_weights=None):
+    # -> веса (P, P, K): вес пары точек, умноженный на вес аспекта
+    aspect_weights = {**DEFAULT_ASPECT_WEIGHTS, **(aspect_weights or {})}
+    point_weights = {**DEFAULT_POINT_WEIGHTS, **(point_weights or {})}
+    k = np.array([aspect_weights[a] for a in ASPECT_NAMES], dtype=np.float32)
+    p = np.array([point_weights[name] for name in POINTS], dtype=np.float32)
+    return np.outer(p, p)[:, :, None] * k
+
+
+def separation(lon_a, lon_b):
+    # lon_a: (P,), lon_b: (..., P) -> угловое расстояние 0..180 для всех пар (..., P, P).
+    # Долготы уже в [0, 360), поэтому обходимся без дорогого взятия остатка
+    d = np.abs(lon_a[:, None] - lon_b[..., None, :])
+    return np.minimum(d, np.float32(360.0) - d)
+
+
+def aspect_strength(lon_a, lon_b):
+    # lon_a: (P,), lon_b: (..., P) -> сила аспектов (..., P, P, K) от 1 (точный) до 0 (граница орбиса)
+    deviation = np.abs(separation(lon_a, lon_b)[..., None] - ASPECT_ANGLES)
+    strength = np.float32(1.0) - deviation / ASPECT_ORBS
+    # fmax, а не maximum: для отсутствующей точки (NaN) сила аспекта 0, а не NaN
+    return np.fmax(strength, np.float32(0.0)), deviation
+
+
+def house_of(lon, cusps):
+    # lon: (..., P), cusps: (..., 12) -> номер дома 1..12 для каждой точки
+    start = cusps[..., None, :]
+    size = (np.roll(cusps, -1, axis=-1) - cusps) % 360.0
+    inside = (lon[..., :, None] - start) % 360.0 < size[..., None, :]
+    house = np.argmax(inside, axis=-1) + 1
+    return np.where(np.isnan(lon), 0, house)
+
+
+def synastry(chart_a, chart_b, aspect_weights=None, point_weights=None):
+    # Полная синастрия двух карт: аспекты, наложения домов и итоговый балл
+    lon_a, cusps_a = chart_vectors(chart_a)
+    lon_b, cusps_b = chart_vectors(chart_b)
+    strength, deviation = aspect_strength(lon_a, lon_b)
+    score = float(np.sum(strength * weights(aspect_weights, point_weights)))
+
+    aspects = []
+    for p, q, k in zip(*np.nonzero(strength > 0.0)):
+        aspects.append({
+            "first": POINTS[p],
+            "second": POINTS[q],
+            "aspect": ASPECT_NAMES[k],
+            "orb": round(float(deviation[p, q, k]), 4),
+            "strength": round(float(strength[p, q, k]), 4),
+        })
+    aspects.sort(key=lambda a: -a["strength"])
+
+    return {
+        "score": round(score, 4),
+        "aspects": aspects,
+        "overlays": {
+            "firstInSecond": dict(zip(POINTS, house_of(lon_a, cusps_b).tolist())),
+            "secondInFirst": dict(zip(POINTS, house_of(lon_b, cusps_a).tolist())),
+        },
+    }
+
+
+# --- ХРАНИЛИЩЕ КАРТ ДЛЯ ПОДБОРА ---
+class ChartStore:
+    def __init__(self, capacity=1024):
+        self.ids = []
+        self.index = {}
+        self.lon = np.full((capacity, len(POINTS)), np.nan, dtype=np.float32)
+        self.cusps = np.zeros((capacity, 12), dtype=np.float32)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, chart_id, chart):
+        lon, cusps = chart_vectors(chart)
+        with self._lock:
+            row = self.index.get(chart_id)
+            if row is None:
+                row = len(self.ids)
+                if row == self.lon.shape[0]:
+                    self._grow()
+                self.ids.append(chart_id)
+                self.index[chart_id] = row
+            self.lon[row] = lon
+            self.cusps[row] = cusps
+
+    def snapshot(self):
+        # Согласованный срез для чтения без блокировки: при росте массивы заменяются новыми
+        with self._lock:
+            n = len(self.ids)
+            return list(self.ids), self.lon[:n], self.cusps[:n]
+
+    def _grow(self):
+        capacity = self.lon.shape[0] * 2
+        lon = np.full((capacity, len(POINTS)), np.nan, dtype=np.float32)
+        cusps = np.zeros((capacity, 12), dtype=np.float32)
+        lon[:self.lon.shape[0]] = self.lon
+        cusps[:self.cusps.shape[0]] = self.cusps
+        self.lon, self.cusps = lon, cusps
+
+    def save(self, path):
+        ids, lon, cusps = self.snapshot()
+        # Через открытый файл: по имени np.savez дописал бы .npz, и load не нашел бы файл по тому же пути.
+        # Пишем во временный файл рядом и переименовываем: при сбое посреди записи старый файл цел
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile(dir=directory, prefix=".chart_store.", delete=False) as f:
+            np.savez(f, ids=np.array(ids, dtype=str), lon=lon, cusps=cusps)
+        os.replace(f.name, path)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        store = cls(capacity=max(1024, len(data["ids"])))
+        n = len(data["ids"])
+        store.ids = data["ids"].tolist()
+        store.index = {chart_id: row for row, chart_id in enumerate(store.ids)}
+        store.lon[:n] = data["lon"]
+        store.cusps[:n] = data["cusps"]
+        return store
+
+
+def rank(chart, store, top=20, aspect_weights=None, point_weights=None, chunk=RANK_CHUNK):
+    # Один ко многим: балл совместимости chart с каждой картой хранилища, лучшие top кандидатов
+    ids, lon_many, _ = store.snapshot()
+    if not ids:
+        return []
+
+    lon_a, _ = chart_vectors(chart)
+    pair_weights = weights(aspect_weights, point_weights).reshape(-1, len(ASPECT_NAMES))
+    scores = np.zeros(len(ids), dtype=np.float32)
+    for start in range(0, len(ids), chunk):
+        block = separation(lon_a, lon_many[start:start + chunk]).reshape(-1, len(POINTS) ** 2)
+        # По аспектам отдельно: промежуточный массив (блок, P*P) вместо (блок, P, P, K),
+        # свертка с весами — матрично-векторное умножение (BLAS)
+        for k in range(len(ASPECT_NAMES)):
+            strength = np.fmax(np.float32(1.0) - np.abs(block - ASPECT_ANGLES[k]) / ASPECT_ORBS[k], np.float32(0.0))
+            scores[start:start + chunk] += strength @ pair_weights[:, k]
+
+    top = max(1, min(top, len(ids)))
+    best = np.argpartition(-scores, top - 1)[:top]
+    best = best[np.argsort(-scores[best])]
+    return [{"id": ids[i], "score": round(float(scores[i]), 4)} for i in best]
+
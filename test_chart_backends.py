@@ -0,0 +1,81 @@
+import random
+
+import pytest
+
+from chart_backends import BACKENDS
+
+# Сверка бэкендов с прямыми вызовами swisseph: максимальное расхождение по каждому телу и куспиду
+SAMPLES = [
+    ("1905/03/01", "06:15", 48.85, 2.35),
+    ("1950/07/20", "23:40", -33.87, 151.21),
+    ("1990/05/17", "14:30", 55.75, 37.6),
+    ("2024/12/31", "00:00", 40.71, -74.0),
+    ("2080/01/15", "12:00", 64.15, -21.94),
+]
+_rng = random.Random(7)
+SAMPLES += [
+    (f"{_rng.randint(1900, 2099)}/{_rng.randint(1, 12):02d}/{_rng.randint(1, 28):02d}",
+     f"{_rng.randint(0, 23):02d}:{_rng.randint(0, 59):02d}",
+     round(_rng.uniform(-60.0, 65.0), 2), round(_rng.uniform(-180.0, 180.0), 2))
+    for _ in range(25)
+]
+
+# Бэкенд -> (модуль для importorskip, допуск по телам, допуск по куспидам) в угловых секундах.
+# ephem: планеты в пределах 1′, кроме Луны (теория ephem, до ~80″ к 2100 году);
+# дома по звездному времени — до ~70″ на высоких широтах
+TOLERANCES = {
+    "tables": ("numpy", 1.0, 1.0),
+    "flatlib": ("flatlib", 1.0, 1.0),
+    "ephem": ("ephem", 60.0, 70.0),
+}
+BODY_TOLERANCE_OVERRIDES = {("ephem", "Moon"): 90.0}
+
+
+def angle_diff_arcsec(a, b):
+    return abs((a - b + 180.0) % 360.0 - 180.0) * 3600.0
+
+
+@pytest.fixture(scope="module")
+def reference():
+    pytest.importorskip("swisseph")
+    backend = BACKENDS["swisseph"]()
+    backend.init_worker()
+    return {sample: backend.calculate(*sample) for sample in SAMPLES}
+
+
+def make_backend(name):
+    pytest.importorskip(TOLERANCES[name][0])
+    backend = BACKENDS[name]()
+    backend.init_worker()
+    return backend
+
+
+@pytest.mark.parametrize("name", list(TOLERANCES))
+def test_backend_matches_swisseph(name, reference):
+    backend = make_backend(name)
+    _, body_tolerance, cusp_tolerance = TOLERANCES[name]
+    for sample, expected in reference.items():
+        actual = backend.calculate(*sample)
+        planets = {p["name"]: p["angle"] for p in actual["planets"]}
+        for p in expected["planets"]:
+            if p["name"] in planets:
+                tolerance = BODY_TOLERANCE_OVERRIDES.get((name, p["name"]), body_tolerance)
+                assert angle_diff_arcsec(p["angle"], planets[p["name"]]) <= tolerance, (name, sample, p["name"])
+        for i, (a, b) in enumerate(zip(expected["houses"], actual["houses"])):
+            assert angle_diff_arcsec(a, b) <= cusp_tolerance, (name, sample, f"House{i + 1}")
+        for angle in ("Ascendant", "MC"):
+            assert angle_diff_arcsec(expected["angles"][angle], actual["angles"][angle]) <= cusp_tolerance, (name, sample, angle)
+
+
+def test_ephem_omits_chiron():
+    backend = make_backend("ephem")
+    names = [p["name"] for p in backend.calculate(*SAMPLES[2])["planets"]]
+    assert "Chiron" not in names
+    assert len(names) == 11
+
+
+def test_full_backends_return_all_bodies(reference):
+    for name in ("tables", "flatlib"):
+        backend = make_backend(name)
+        names = [p["name"] for p in backend.calculate(*SAMPLES[2])["planets"]]
+        assert names == [p["name"] for p in reference[SAMPLES[2]]["planets"]]
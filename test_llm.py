@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+from llm import LLMClient, StubModel, sse_event
+
+
+def make_client(delay=0.05, **kwargs):
+    client = LLMClient(**kwargs)
+    client.model = StubModel(delay=delay)
+    return client
+
+
+async def read_stream(client, prompt, **kwargs):
+    return "".join([chunk async for chunk in client.stream(prompt, **kwargs)])
+
+
+def test_concurrent_identical_prompts_share_one_call():
+    async def scenario():
+        client = make_client()
+        texts = await asyncio.gather(*(client.generate("same") for _ in range(5)))
+        return client, texts
+
+    client, texts = asyncio.run(scenario())
+    assert client.model.calls == 1
+    assert texts == ["[stub] same"] * 5
+    assert client.coalesced == 4
+
+
+def test_cache_entries_expire_after_ttl():
+    async def scenario():
+        client = make_client(delay=0.0, cache_ttl=0.05)
+        await client.generate("ttl")
+        await client.generate("ttl")
+        calls_before_expiry = client.model.calls
+        await asyncio.sleep(0.1)
+        await client.generate("ttl")
+        return calls_before_expiry, client.model.calls
+
+    assert asyncio.run(scenario()) == (1, 2)
+
+
+def test_uncached_prompts_always_call_the_model():
+    async def scenario():
+        client = make_client(delay=0.0)
+        await asyncio.gather(*(client.generate("generic", cache=False) for _ in range(3)))
+        await read_stream(client, "generic", cache=False)
+        return client
+
+    client = asyncio.run(scenario())
+    assert client.model.calls == 4
+    assert client.stats()["cache_entries"] == 0
+
+
+def test_concurrent_streams_are_coalesced_and_cached():
+    async def scenario():
+        client = make_client()
+        texts = await asyncio.gather(*(read_stream(client, "one two three") for _ in range(3)))
+        cached = await read_stream(client, "one two three")
+        return client, texts, cached
+
+    client, texts, cached = asyncio.run(scenario())
+    assert client.model.calls == 1
+    assert texts == ["[stub] one two three"] * 3
+    assert cached == "[stub] one two three"
+
+
+def test_slow_stream_reader_does_not_hold_a_slot():
+    async def scenario():
+        client = make_client(delay=0.02, concurrency=1)
+        stream = client.stream("slow reader")
+        await stream.__anext__()  # клиент прочитал первый кусок и замолчал
+        await asyncio.sleep(0.1)
+        started = time.perf_counter()
+        await asyncio.wait_for(client.generate("other"), 1.0)
+        elapsed = time.perf_counter() - started
+        rest = "".join([chunk async for chunk in stream])
+        return elapsed, rest
+
+    elapsed, rest = asyncio.run(scenario())
+    assert elapsed < 0.5
+    assert rest == "slow reader"
+
+
+def test_stream_errors_reach_every_reader():
+    class FailingModel(StubModel):
+        async def generate_content_async(self, prompt, stream=False):
+            raise RuntimeError("model down")
+
+    async def scenario():
+        client = LLMClient()
+        client.model = FailingModel(delay=0.0)
+        results = await asyncio.gather(*(read_stream(client, "x") for _ in range(2)), return_exceptions=True)
+        return results
+
+    assert all(isinstance(r, RuntimeError) for r in asyncio.run(scenario()))
+
+
+def test_sse_event_framing():
+    assert sse_event("hello") == "data: hello\n\n"
+    assert sse_event("a\nb") == "data: a\ndata: b\n\n"
+    assert sse_event("", event="done") == "event: done\ndata: \n\n"
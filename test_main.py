@@ -0,0 +1,25 @@
+BIRTH = {"birthDateTime": "1990-05-17T14:30:00Z", "latitude": 55.75, "longitude": 37.61, "zoneId": "UTC"}
+
+
+def test_calculate_rejects_invalid_datetime(client):
+    for value in ("garbage", "1990-13-45T10:00"):
+        response = client.post("/calculate", json={**BIRTH, "birthDateTime": value})
+        assert response.status_code == 422, value
+
+
+def test_batch_reports_invalid_datetime_per_item(client):
+    items = [BIRTH, {**BIRTH, "birthDateTime": "bad"}, {**BIRTH, "birthDateTime": "1990-13-45T10:00"}]
+    response = client.post("/calculate/batch", json=items)
+    assert response.status_code == 200
+    first, bad, impossible = response.json()
+    assert first["ok"] and len(first["chart"]["planets"]) == 12
+    assert not bad["ok"] and "birthDateTime" in bad["error"]
+    assert not impossible["ok"] and "birthDateTime" in impossible["error"]
+
+
+def test_equivalent_datetimes_share_etag(client):
+    etags = {
+        client.post("/calculate", json={**BIRTH, "birthDateTime": value}).headers["etag"]
+        for value in ("1990-5-17T14:30", "1990-05-17T14:30:59Z", "1990/05/17 14:30")
+    }
+    assert len(etags) == 1
@@ -0,0 +1,70 @@
+import numpy as np
+
+from chart_backends import BODY_NAMES
+from synastry import ChartStore, rank, synastry
+
+BIRTH = {"birthDateTime": "1990-05-17T14:30:00Z", "latitude": 55.75, "longitude": 37.61, "zoneId": "UTC"}
+
+
+def make_chart(shift, skip=()):
+    planets = [{"name": name, "angle": (i * 37.0 + shift) % 360.0} for i, name in enumerate(BODY_NAMES) if name not in skip]
+    return {
+        "planets": planets,
+        "houses": [(h * 30.0 + shift) % 360.0 for h in range(12)],
+        "angles": {"Ascendant": shift, "MC": (shift + 270.0) % 360.0},
+    }
+
+
+def test_missing_point_does_not_poison_score():
+    # Карта без Хирона (как у бэкенда ephem)
+    full, partial = make_chart(10.0), make_chart(95.0, skip=("Chiron",))
+    report = synastry(full, partial)
+    assert np.isfinite(report["score"])
+    assert report["aspects"]
+    assert all(a["second"] != "Chiron" for a in report["aspects"])
+
+
+def test_rank_scores_rows_with_missing_points():
+    store = ChartStore()
+    store.add("full", make_chart(10.0))
+    store.add("partial", make_chart(95.0, skip=("Chiron",)))
+    ranked = rank(make_chart(95.0, skip=("Chiron",)), store)
+    assert [c["id"] for c in ranked] == ["partial", "full"]
+    assert all(np.isfinite(c["score"]) for c in ranked)
+
+
+def test_rank_clamps_top():
+    store = ChartStore()
+    for i in range(5):
+        store.add(f"c{i}", make_chart(i * 20.0))
+    assert len(rank(make_chart(0.0), store, top=-3)) == 1
+    assert len(rank(make_chart(0.0), store, top=100)) == 5
+
+
+def test_store_round_trip_on_path_without_suffix(tmp_path):
+    path = tmp_path / "store"
+    store = ChartStore()
+    store.add("a", make_chart(10.0))
+    store.add("b", make_chart(95.0, skip=("Chiron",)))
+    store.save(str(path))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["store"]
+
+    loaded = ChartStore.load(str(path))
+    assert loaded.ids == ["a", "b"]
+    ids, lon, _ = loaded.snapshot()
+    np.testing.assert_array_equal(lon, store.snapshot()[1])
+
+
+def test_rank_endpoint_validates_top(client):
+    for top in (0, -3):
+        assert client.post("/synastry/rank", json={"birth": BIRTH, "top": top}).status_code == 422
+    assert client.post("/synastry/rank", json={"birth": BIRTH, "top": 3}).status_code == 200
+
+
+def test_candidates_are_persisted_after_each_batch(client, tmp_path, monkeypatch):
+    import main
+    path = tmp_path / "store"
+    monkeypatch.setattr(main, "CHART_STORE_PATH", str(path))
+    response = client.post("/synastry/candidates", json=[{"id": "persisted", "birth": BIRTH}])
+    assert response.status_code == 200
+    assert "persisted" in ChartStore.load(str(path)).ids
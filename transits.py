@@ -0,0 +1,199 @@
+import logging
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from chart_backends import BODY_NAMES, SIGNS
+
+logger = logging.getLogger(__name__)
+
+# --- ТРАНЗИТЫ ---
+# Положения всех тел на сетке времени считаются одним векторным запросом к таблицам
+# (ephemeris_tables), события ищутся по смене знака на сетке и уточняются методом Illinois сразу
+# для всех найденных интервалов. Chart на каждый шаг не строится.
+
+ASPECTS = {"conjunction": 0.0, "sextile": 60.0, "square": 90.0, "trine": 120.0, "opposition": 180.0}
+STEPS = {"day": 1.0, "hour": 1.0 / 24.0}
+
+# Уточнение корня методом Illinois (регула фальси с защитой от застревания):
+# положение тела по времени гладкое, поэтому хватает нескольких вычислений таблиц
+REFINE_ITERATIONS = 12
+LONGITUDE_TOLERANCE = 1e-7
+SPEED_TOLERANCE = 1e-9
+
+SIGN_BOUNDARIES = np.arange(12) * 30.0
+
+J2000 = datetime(2000, 1, 1, 12, 0)
+J2000_JD = 2451545.0
+
+tables = None
+
+
+def get_tables():
+    # Таблицы открываются лениво, по одному разу в каждом процессе-воркере.
+    # Без таблиц положения считаются через swisseph (медленнее, тот же интерфейс);
+    # без swisseph — ImportError, и /transits отвечает 503
+    global tables
+    if tables is None:
+        from ephemeris_tables import open_positions
+        tables = open_positions()
+    return tables
+
+
+def julian_day(date_raw, time_raw):
+    moment = datetime.strptime(f"{date_raw} {time_raw}", "%Y/%m/%d %H:%M")
+    return J2000_JD + (moment - J2000).total_seconds() / 86400.0
+
+
+def jd_to_iso(jd):
+    moment = J2000 + timedelta(days=float(jd) - J2000_JD)
+    return moment.replace(microsecond=0).isoformat() + "Z"
+
+
+def wrap180(values):
+    return (values + 180.0) % 360.0 - 180.0
+
+
+def refine_roots(func, lo, hi, f_lo, f_hi, tolerance):
+    # Векторный поиск корней: func(jds) -> значения, в каждом интервале [lo, hi] значения
+    # на концах разного знака. Все интервалы уточняются одновременно.
+    a, b, fa, fb = lo.copy(), hi.copy(), f_lo.copy(), f_hi.copy()
+    side = np.zeros(a.shape, dtype=np.int8)
+    c = 0.5 * (a + b)
+    for _ in range(REFINE_ITERATIONS):
+        c = np.where(fb != fa, (a * fb - b * fa) / (fb - fa), 0.5 * (a + b))
+        fc = func(c)
+        if np.all(np.abs(fc) < tolerance):
+            break
+        keep_b = np.sign(fc) == np.sign(fa)
+        a, fa = np.where(keep_b, c, a), np.where(keep_b, fc, fa)
+        b, fb = np.where(keep_b, b, c), np.where(keep_b, fb, fc)
+        # Illinois: если тот же конец сдвигается второй раз подряд, ослабляем противоположный
+        fb = np.where(keep_b & (side == 1), 0.5 * fb, fb)
+        fa = np.where(~keep_b & (side == -1), 0.5 * fa, fa)
+        side = np.where(keep_b, 1, -1).astype(np.int8)
+    return c
+
+
+def crossings(lon, targets):
+    # Какие цели (долготы) тело пересекает между соседними отсчетами сетки.
+    # Долгота разворачивается в непрерывную, цели сортируются, и для каждого интервала
+    # [lon_i, lon_i+1] попадающие в него цели находятся через searchsorted — O(N + событий),
+    # без матрицы цели x время. За шаг тело проходит меньше 360°.
+    track = np.unwrap(lon, period=360.0)
+    lo = np.minimum(track[:-1], track[1:])
+    hi = np.maximum(track[:-1], track[1:])
+    base = np.floor(lo / 360.0) * 360.0
+
+    normalized = targets % 360.0
+    order = np.argsort(normalized)
+    ordered = np.concatenate([normalized[order], normalized[order] + 360.0])
+    ordered_idx = np.concatenate([order, order])
+
+    start = np.searchsorted(ordered, lo - base, side="right")
+    stop = np.searchsorted(ordered, hi - base, side="right")
+    counts = stop - start
+    interval_idx = np.repeat(np.arange(lo.size), counts)
+    within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return ordered_idx[np.repeat(start, counts) + within], interval_idx
+
+
+def aspect_targets(natal, aspects):
+    # Цели — натальная точка ± угол аспекта: (массив долгот, [(точка, аспект)])
+    targets, labels = [], []
+    for point, natal_lon in natal.items():
+        for aspect in aspects:
+            angle = ASPECTS[aspect]
+            for side in ({angle, -angle} if 0.0 < angle < 180.0 else {angle}):
+                targets.append(natal_lon + side)
+                labels.append((point, aspect))
+    return np.array(targets, dtype=float), labels
+
+
+def body_events(source, body, jds, lon, speed, targets, labels, stations):
+    # Все события одного тела: аспекты и ингрессии сводятся к корням lon(t) = цель и
+    # уточняются одним вызовом, станции — корни скорости
+    events = []
+
+    # Аспекты к натальным точкам и ингрессии (границы знаков) ищутся одним проходом
+    n_targets = targets.size
+    all_targets = np.concatenate([targets, SIGN_BOUNDARIES])
+    t_idx, n_idx = crossings(lon, all_targets)
+    if n_idx.size:
+        goal = all_targets[t_idx]
+        exact = refine_roots(
+            lambda x: wrap180(source.positions(x, [body])[body][0] - goal),
+            jds[n_idx], jds[n_idx + 1],
+            wrap180(lon[n_idx] - goal), wrap180(lon[n_idx + 1] - goal),
+            LONGITUDE_TOLERANCE,
+        )
+        forward = wrap180(lon[n_idx + 1] - lon[n_idx]) > 0
+        for t, i, jd, fwd in zip(t_idx, n_idx, exact, forward):
+            if t < n_targets:
+                point, aspect = labels[t]
+                events.append({"type": "aspect", "jd": float(jd), "body": body, "aspect": aspect, "natal": point})
+            else:
+                entered = (t - n_targets) if fwd else (t - n_targets - 1)
+                events.append({"type": "ingress", "jd": float(jd), "body": body, "sign": SIGNS[entered % 12], "retrograde": not bool(fwd)})
+
+    # Станции: смена знака скорости
+    s_idx = np.nonzero(np.sign(speed[:-1]) * np.sign(speed[1:]) < 0)[0] if stations else np.array([], dtype=np.int64)
+    if s_idx.size:
+        exact = refine_roots(
+            lambda x: source.positions(x, [body])[body][2],
+            jds[s_idx], jds[s_idx + 1], speed[s_idx], speed[s_idx + 1],
+            SPEED_TOLERANCE,
+        )
+        for i, jd in zip(s_idx, exact):
+            events.append({"type": "station", "jd": float(jd), "body": body, "direction": "retrograde" if speed[i] > 0 else "direct"})
+
+    return events
+
+
+def compute_transits(natal, start_jd, end_jd, step_days, bodies=None, aspects=None, include_positions=False):
+    # natal: {точка: долгота}; возвращает события по времени и (по запросу) положения на сетке
+    source = get_tables()
+    bodies = bodies or BODY_NAMES
+    aspects = aspects or list(ASPECTS)
+
+    jds = np.arange(start_jd, end_jd + step_days * 0.5, step_days)
+    positions = source.positions(jds, bodies)
+
+    targets, labels = aspect_targets(natal, aspects)
+    events = []
+    for body in bodies:
+        lon, _, speed = positions[body]
+        # Средний узел всегда попятный, станций у Солнца и Луны не бывает
+        stations = body not in ("Sun", "Moon", "NNode")
+        events += body_events(source, body, jds, lon, speed, targets, labels, stations)
+
+    events.sort(key=lambda e: e["jd"])
+    for e in events:
+        e["time"] = jd_to_iso(e["jd"])
+
+    result = {"start": jd_to_iso(start_jd), "end": jd_to_iso(end_jd), "events": events}
+    if include_positions:
+        result["positions"] = {
+            "time": [jd_to_iso(jd) for jd in jds],
+            "bodies": {body: np.round(positions[body][0], 6).tolist() for body in bodies},
+        }
+    return result
+
+
+def natal_points(chart):
+    points = {p["name"]: p["angle"] for p in chart["planets"]}
+    points.update(chart["angles"])
+    return points
+
+
+def describe_events(events, limit=8):
+    # Короткое текстовое описание для промпта гороскопа
+    lines = []
+    for e in events[:limit]:
+        if e["type"] == "aspect":
+            lines.append(f"{e['body']} {e['aspect']} натальный {e['natal']}")
+        elif e["type"] == "ingress":
+            lines.append(f"{e['body']} входит в {e['sign']}")
+        else:
+            lines.append(f"{e['body']} станция ({e['direction']})")
+    return "; ".join(lines)